@@ -1,26 +1,44 @@
 from __future__ import annotations
 
+import contextlib
+import functools
 import logging
 import os
 import re
+import shutil
 from pathlib import Path
 from typing import Iterable, List
 
-from PIL import Image, ImageOps
-from PIL.ImageQt import ImageQt
-
-from PySide6.QtCore import Qt
-from PySide6.QtGui import QKeySequence, QPixmap, QShortcut
+from PySide6.QtCore import (
+    QModelIndex,
+    QObject,
+    QRunnable,
+    QSize,
+    QStringListModel,
+    Qt,
+    QThreadPool,
+    Signal,
+)
+from PySide6.QtGui import (
+    QImage,
+    QImageIOHandler,
+    QImageReader,
+    QKeySequence,
+    QPixmap,
+    QPixmapCache,
+    QShortcut,
+)
 from PySide6.QtWidgets import (
     QApplication,
     QFileDialog,
     QHBoxLayout,
     QLabel,
-    QListWidget,
-    QListWidgetItem,
+    QAbstractItemView,
+    QListView,
     QMainWindow,
     QMessageBox,
     QPushButton,
+    QSizePolicy,
     QTextEdit,
     QVBoxLayout,
     QWidget,
@@ -29,35 +47,146 @@ from PySide6.QtWidgets import (
 
 logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
 
+_SPLIT_DIGITS = re.compile(r"([0-9]+)").split
+# Group 1 is everything after the last path separator, like os.path.basename
+_BASENAME = re.compile(rf"(?:.*[{re.escape(os.sep + (os.altsep or ''))}])?(.*)", re.DOTALL).match
+
+
+@functools.lru_cache(maxsize=100_000)
+def _nat_key(base: str) -> tuple:
+    # split() alternates text and digit runs, so the odd slots are always [0-9]+
+    # and two keys never compare a str against an int
+    parts = _SPLIT_DIGITS(base.lower())
+    parts[1::2] = map(int, parts[1::2])
+    return tuple(parts)
+
 
 def natural_sort(paths: Iterable[str]) -> List[str]:
     """
     Natural sort by basename (so file2 < file10).
     """
-    def convert(text: str):
-        return int(text) if text.isdigit() else text.lower()
+    return sorted(paths, key=lambda p: _nat_key(_BASENAME(p)[1]))
 
-    _re = re.compile(r"([0-9]+)")
 
-    def alphanum_key(p: str):
-        base = os.path.basename(p)
-        return [convert(c) for c in _re.split(base)]
+def _read_with_qt(reader: QImageReader, box: QSize) -> QImage:
+    """
+    Decode with Qt's image reader, downscaling during the read when needed.
+    """
+    reader.setAutoTransform(True)
+    # The scaled size applies before the EXIF rotation
+    if reader.transformation() & QImageIOHandler.TransformationRotate90:
+        box = box.transposed()
+    # size() only parses the header; images that already fit are read as-is
+    size = reader.size()
+    if size.isValid() and (size.width() > box.width() or size.height() > box.height()):
+        size.scale(box, Qt.KeepAspectRatio)
+        reader.setScaledSize(size)
+    image = reader.read()
+    if image.isNull():
+        raise OSError(reader.errorString())
+    if image.width() > box.width() or image.height() > box.height():
+        # Header had no size, so the reader could not scale up front
+        image = image.scaled(box, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+    return image
+
+
+def _read_with_pillow(path: Path, box: QSize) -> QImage:
+    # Only formats Qt can't read get here, so Pillow and its Qt glue load on first use
+    from PIL import Image, ImageOps
+    from PIL.ImageQt import ImageQt
+
+    max_w, max_h = box.width(), box.height()
+    with Image.open(path) as im:
+        # Qt reads ordinary JPEGs itself, so draft() and the bicubic shortcut only matter
+        # for the odd JPEG/MPO Qt refuses. draft() is a no-op for other formats and must
+        # happen before exif_transpose, which loads the pixels.
+        im.draft("RGB", (max_w * 2, max_h * 2))
+        resample = Image.BICUBIC if im.format in ("JPEG", "MPO") else Image.LANCZOS
+        # Most photos are upright; skip the transpose (and its full copy) for those
+        if im.getexif().get(0x0112, 1) != 1:
+            im = ImageOps.exif_transpose(im)
+        im.thumbnail((max_w, max_h), resample)
+        # ImageQt wraps a buffer owned by the wrapper; copy so the QImage can outlive it
+        # once it is queued across threads
+        return ImageQt(im).copy()
+
+
+def decode_image(path: Path, box: QSize) -> QImage:
+    """
+    Decode an image scaled down to fit inside box. Safe to call off the GUI thread.
+    """
+    # canRead() only sniffs the header; anything Qt has no plugin for goes through Pillow
+    reader = QImageReader(str(path))
+    if reader.canRead():
+        return _read_with_qt(reader, box)
+    return _read_with_pillow(path, box)
 
-    return sorted(paths, key=alphanum_key)
+
+def _fit_image(image: QImage, size: QSize) -> QImage:
+    """
+    Scale image down to fit inside size; images that already fit are returned as-is.
+    """
+    if size.isEmpty() or (image.width() <= size.width() and image.height() <= size.height()):
+        return image
+    return image.scaled(size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+
+
+class _DecodeSignals(QObject):
+    # key, path, label-fitted image, source image
+    finished = Signal(str, object, QImage, QImage)
+    failed = Signal(str, object)
+
+
+class _DecodeJob(QRunnable):
+    """
+    Decodes one image on the thread pool and reports back through signals.
+    The source is decoded to fit box and also fitted to the label, so the GUI
+    thread never has to resample while navigating.
+    The key identifies the result in the pixmap cache and lets the window drop
+    results for images that are no longer selected.
+    """
+
+    def __init__(self, key: str, path: Path, box: QSize, fit: QSize) -> None:
+        super().__init__()
+        self.key = key
+        self.path = path
+        self.box = box
+        self.fit = fit
+        self.signals = _DecodeSignals()
+
+    def run(self) -> None:
+        try:
+            source = decode_image(self.path, self.box)
+            fitted = _fit_image(source, self.fit)
+        except Exception:
+            logging.exception("Unable to decode image")
+            self.signals.failed.emit(self.key, self.path)
+            return
+        self.signals.finished.emit(self.key, self.path, fitted, source)
 
 
 class CaptionIMGMain(QMainWindow):
     SUPPORTED_EXT = (".bmp", ".jpg", ".jpeg", ".png", ".webp", ".tiff")
+    # Thread pool priority of the image on screen; neighbour prefetches run at 0
+    VISIBLE_PRIORITY = 1
 
     def __init__(self) -> None:
         super().__init__()
         self.setWindowTitle("CaptionIMG (PySide6)")
         self.resize(1200, 800)
 
-        self.file_map: dict[str, Path] = {}
         self.current_image_name: str | None = None
         self.current_image_path: Path | None = None
+        self._paths: list[Path] = []
+        # Set while the selection is put back after a cancelled switch
+        self._reverting = False
         self.unsaved = False
+        # Cache key of the image waiting to be shown, and jobs queued or decoding by key
+        self._wanted_key: str | None = None
+        self._pending_jobs: dict[str, _DecodeJob] = {}
+        # Decoded pixmap of the current image, before fitting it to the label
+        self._source_pix: QPixmap | None = None
+        QPixmapCache.setCacheLimit(64 * 1024)  # KiB
 
         self._build_ui()
         self._connect_shortcuts()
@@ -70,9 +199,14 @@ class CaptionIMGMain(QMainWindow):
         central.setLayout(main_layout)
 
         # Left: list
-        self.list_widget = QListWidget()
-        self.list_widget.setMinimumWidth(300)
-        main_layout.addWidget(self.list_widget, stretch=0)
+        # Model/view so rows are only laid out and painted when visible
+        self.list_model = QStringListModel()
+        self.list_view = QListView()
+        self.list_view.setModel(self.list_model)
+        self.list_view.setUniformItemSizes(True)
+        self.list_view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.list_view.setMinimumWidth(300)
+        main_layout.addWidget(self.list_view, stretch=0)
 
         # Right: image + caption area
         right_v = QVBoxLayout()
@@ -80,6 +214,8 @@ class CaptionIMGMain(QMainWindow):
 
         self.image_label = QLabel(alignment=Qt.AlignCenter)
         self.image_label.setMinimumSize(400, 300)
+        # Don't let the pixmap's size hint stop the label from shrinking with the window
+        self.image_label.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Ignored)
         self.image_label.setStyleSheet("border: 1px solid #999;")
         right_v.addWidget(self.image_label, stretch=3)
 
@@ -102,7 +238,7 @@ class CaptionIMGMain(QMainWindow):
         # Connections
         self.open_btn.clicked.connect(self.open_images)
         self.save_btn.clicked.connect(self.save_caption)
-        self.list_widget.currentItemChanged.connect(self._on_selection_changed)
+        self.list_view.selectionModel().currentChanged.connect(self._on_selection_changed)
         self.caption_edit.textChanged.connect(self._on_text_changed)
 
     def _connect_shortcuts(self) -> None:
@@ -120,25 +256,28 @@ class CaptionIMGMain(QMainWindow):
                 return
 
             selected = natural_sort(selected)
-            self.file_map.clear()
-            self.list_widget.clear()
+            # Deselect first so unsaved changes to the current caption are handled
+            self.list_view.setCurrentIndex(QModelIndex())
+            if self.unsaved:
+                # Cancelled, or the save failed; keep the current list and caption
+                return
 
-            for fp in selected:
-                p = Path(fp)
-                name = p.name
-                self.file_map[name] = p
-                self.list_widget.addItem(QListWidgetItem(name))
+            # Full paths are kept by row so same-named files from different folders stay distinct
+            self._paths = [Path(fp) for fp in selected]
+            self.list_model.setStringList([p.name for p in self._paths])
 
             self.status.showMessage(f"Loaded {len(selected)} image(s)")
-            if self.list_widget.count() > 0:
-                self.list_widget.setCurrentRow(0)
+            if self._paths:
+                self.list_view.setCurrentIndex(self.list_model.index(0))
         except Exception as exc:
             logging.exception("Error while opening images")
             QMessageBox.critical(self, "Error", f"Failed to open images:\n{exc}")
 
-    def _on_selection_changed(self, current: QListWidgetItem | None, previous: QListWidgetItem | None) -> None:
+    def _on_selection_changed(self, current: QModelIndex, previous: QModelIndex) -> None:
+        if self._reverting:
+            return
         try:
-            if previous and self.unsaved:
+            if previous.isValid() and self.unsaved:
                 # Ask to save before switching
                 resp = QMessageBox.question(
                     self,
@@ -148,74 +287,171 @@ class CaptionIMGMain(QMainWindow):
                 )
                 if resp == QMessageBox.Cancel:
                     # revert selection back to previous
-                    prev_row = self.list_widget.row(previous)
-                    self.list_widget.blockSignals(True)
-                    self.list_widget.setCurrentRow(prev_row)
-                    self.list_widget.blockSignals(False)
+                    self._set_current_row_silently(previous.row())
                     return
                 elif resp == QMessageBox.Yes:
                     if not self.save_caption():
                         # If save failed, revert
-                        prev_row = self.list_widget.row(previous)
-                        self.list_widget.blockSignals(True)
-                        self.list_widget.setCurrentRow(prev_row)
-                        self.list_widget.blockSignals(False)
+                        self._set_current_row_silently(previous.row())
                         return
                 else:
                     # Discard changes
                     self.unsaved = False
 
-            if not current:
+            path = self._path_for_row(current.row()) if current.isValid() else None
+            if path is None:
                 self._clear_image_and_caption()
                 return
 
-            name = current.text()
-            path = self.file_map.get(name)
-            if not path:
-                return
-
-            self.current_image_name = name
+            self.current_image_name = path.name
             self.current_image_path = path
             self._display_image(path)
             self._load_caption(path)
             self.unsaved = False
+            self._prefetch_neighbors(current.row())
         except Exception:
             logging.exception("Error on selection change")
 
+    def _display_box(self) -> QSize:
+        # scale to a reasonable size for display while preserving aspect
+        screen_size = QApplication.primaryScreen().size()
+        max_w = int(screen_size.width() * 0.5)
+        max_h = int(screen_size.height() * 0.5)
+        # Decode at up to twice the label size so resizing can rescale without re-decoding
+        lbl_size = self.image_label.size()
+        if not lbl_size.isEmpty():
+            max_w = min(max_w, lbl_size.width() * 2)
+            max_h = min(max_h, lbl_size.height() * 2)
+        return QSize(max_w, max_h)
+
+    def _fit_size(self) -> QSize:
+        return self.image_label.contentsRect().size()
+
+    @staticmethod
+    def _cache_key(path: Path, fit: QSize) -> str:
+        # The decode box is derived from the label size too, so fit identifies both images
+        return f"{path}|{fit.width()}x{fit.height()}"
+
     def _display_image(self, path: Path) -> None:
+        fit = self._fit_size()
+        key = self._cache_key(path, fit)
+        self._wanted_key = key
+
+        fit_pix = QPixmap()
+        if QPixmapCache.find(key, fit_pix):
+            src_pix = QPixmap()
+            if not QPixmapCache.find(key + "|src", src_pix):
+                src_pix = fit_pix
+            self._show_pixmap(fit_pix, src_pix)
+            self.status.showMessage(f"{path.name} — {path}")
+            return
+
+        self.status.showMessage(f"Loading {path.name}...")
+        self._start_decode(key, path, self._display_box(), fit, self.VISIBLE_PRIORITY)
+
+    def _prefetch_neighbors(self, row: int) -> None:
+        box = self._display_box()
+        fit = self._fit_size()
+        neighbors = {}
+        for offset in (1, -1, 2, -2):
+            path = self._path_for_row(row + offset)
+            if path is not None:
+                neighbors[self._cache_key(path, fit)] = path
+
+        # Drop queued jobs that are no longer near the current row; running ones finish
+        pool = QThreadPool.globalInstance()
+        for key, job in list(self._pending_jobs.items()):
+            if key != self._wanted_key and key not in neighbors and pool.tryTake(job):
+                del self._pending_jobs[key]
+
+        for key, path in neighbors.items():
+            if not QPixmapCache.find(key, QPixmap()):
+                self._start_decode(key, path, box, fit)
+
+    def _start_decode(self, key: str, path: Path, box: QSize, fit: QSize, priority: int = 0) -> None:
+        # Decode off the GUI thread; skip images that are already on the way
+        pool = QThreadPool.globalInstance()
+        job = self._pending_jobs.get(key)
+        if job is not None:
+            # A still-queued prefetch just became visible; requeue it ahead of the rest
+            if priority > 0 and pool.tryTake(job):
+                pool.start(job, priority)
+            return
+        job = _DecodeJob(key, path, box, fit)
+        # The window keeps the job alive, so tryTake() never sees a deleted runnable
+        job.setAutoDelete(False)
+        job.signals.finished.connect(self._on_image_decoded)
+        job.signals.failed.connect(self._on_image_failed)
+        self._pending_jobs[key] = job
+        pool.start(job, priority)
+
+    def _on_image_decoded(self, key: str, path: Path, fitted: QImage, source: QImage) -> None:
+        self._pending_jobs.pop(key, None)
+        src_pix = QPixmap.fromImage(source)
+        # Share the pixmap when the source already fit the label
+        fit_pix = src_pix if fitted.size() == source.size() else QPixmap.fromImage(fitted)
+        QPixmapCache.insert(key, fit_pix)
+        QPixmapCache.insert(key + "|src", src_pix)
+        if key != self._wanted_key:
+            return
+        if key == self._cache_key(path, self._fit_size()):
+            self._show_pixmap(fit_pix, src_pix)
+        else:
+            # The label was resized while this was decoding; fit the source to the new size
+            self._source_pix = src_pix
+            self._fit_source_to_label()
+        self.status.showMessage(f"{path.name} — {path}")
+
+    def _on_image_failed(self, key: str, path: Path) -> None:
+        self._pending_jobs.pop(key, None)
+        if key != self._wanted_key:
+            return
+        self._source_pix = None
+        self.image_label.clear()
+        QMessageBox.warning(self, "Warning", f"Could not open image:\n{path}")
+
+    def _show_pixmap(self, fit_pix: QPixmap, src_pix: QPixmap) -> None:
+        # fit_pix is already sized for the label; src_pix is only kept for resizes
+        self._source_pix = src_pix
+        self.image_label.setPixmap(fit_pix)
+
+    def _fit_source_to_label(self) -> None:
+        # The only GUI-thread resample; used when the label size changed after decoding
+        pix = self._source_pix
+        lbl_size = self._fit_size()
+        if pix.width() > lbl_size.width() or pix.height() > lbl_size.height():
+            pix = pix.scaled(lbl_size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        self.image_label.setPixmap(pix)
+
+    def resizeEvent(self, event) -> None:
+        super().resizeEvent(event)
+        # Rescale the decoded pixmap we already have instead of decoding again
+        if self._source_pix is not None:
+            self._fit_source_to_label()
+
+    def _path_for_row(self, row: int) -> Path | None:
+        if 0 <= row < len(self._paths):
+            return self._paths[row]
+        return None
+
+    def _set_current_row_silently(self, row: int) -> None:
+        # Only skip our own slot; the view still needs the selection model's signals
+        # to repaint the highlighted row
+        self._reverting = True
         try:
-            with Image.open(path) as im:
-                im = ImageOps.exif_transpose(im)
-                # scale to a reasonable size for display while preserving aspect
-                screen_size = QApplication.primaryScreen().size()
-                max_w = int(screen_size.width() * 0.5)
-                max_h = int(screen_size.height() * 0.5)
-                im.thumbnail((max_w, max_h), Image.LANCZOS)
-
-                qim = ImageQt(im)  # ImageQt returns a QImage compatible object
-                pix = QPixmap.fromImage(qim)
-
-                # Further scale to the label size while keeping aspect ratio
-                lbl_size = self.image_label.size()
-                if not lbl_size.isEmpty():
-                    pix = pix.scaled(lbl_size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-
-                self.image_label.setPixmap(pix)
-                self.status.showMessage(f"{path.name} — {path}")
-        except Exception:
-            logging.exception("Unable to display image")
-            QMessageBox.warning(self, "Warning", f"Could not open image:\n{path}")
+            self.list_view.setCurrentIndex(self.list_model.index(row))
+        finally:
+            self._reverting = False
 
     def _load_caption(self, path: Path) -> None:
         caption_file = path.with_suffix(".txt")
-        if caption_file.exists():
-            try:
-                text = caption_file.read_text(encoding="utf-8")
-            except Exception:
-                logging.exception("Failed to read caption")
-                QMessageBox.warning(self, "Warning", f"Failed to read caption file:\n{caption_file}")
-                text = ""
-        else:
+        try:
+            text = caption_file.read_text(encoding="utf-8")
+        except FileNotFoundError:
+            text = ""
+        except Exception:
+            logging.exception("Failed to read caption")
+            QMessageBox.warning(self, "Warning", f"Failed to read caption file:\n{caption_file}")
             text = ""
 
         self.caption_edit.blockSignals(True)
@@ -231,30 +467,56 @@ class CaptionIMGMain(QMainWindow):
             QMessageBox.information(self, "No image", "No image selected to save caption for.")
             return False
         caption_file = self.current_image_path.with_suffix(".txt")
-        text = self.caption_edit.toPlainText()
+        tmp_file = self.current_image_path.with_suffix(".txt.tmp")
+        # Same bytes write_text would produce, so they can be compared with what's on disk
+        data = self.caption_edit.toPlainText().replace("\n", os.linesep).encode("utf-8")
+        try:
+            old = caption_file.read_bytes()
+        except OSError:
+            old = None
+        if old == data:
+            # Nothing changed; skip the write so synced folders and file watchers stay quiet
+            self.unsaved = False
+            self.status.showMessage("No changes", 3000)
+            return True
         try:
-            caption_file.write_text(text, encoding="utf-8")
+            # Write next to the target, flush it to disk and swap it in, so neither a crash
+            # nor a power loss leaves a truncated caption
+            with open(tmp_file, "wb") as fh:
+                fh.write(data)
+                fh.flush()
+                os.fsync(fh.fileno())
+            # Keep the permissions of an existing caption instead of the umask default
+            with contextlib.suppress(FileNotFoundError):
+                shutil.copymode(caption_file, tmp_file)
+            os.replace(tmp_file, caption_file)
             self.unsaved = False
-            QMessageBox.information(self, "Saved", f"Caption saved:\n{caption_file}")
+            self.status.showMessage(f"Saved {caption_file.name}", 3000)
             return True
         except Exception:
             logging.exception("Failed to save caption")
+            with contextlib.suppress(OSError):
+                tmp_file.unlink(missing_ok=True)
             QMessageBox.critical(self, "Error", "There was an error while saving the caption.")
             return False
 
     def _on_text_changed(self) -> None:
-        self.unsaved = True
+        # Fires on every keystroke; only the first edit needs to flip the flag
+        if not self.unsaved:
+            self.unsaved = True
 
     def _navigate(self, step: int) -> None:
-        count = self.list_widget.count()
+        count = self.list_model.rowCount()
         if count == 0:
             return
-        current_row = self.list_widget.currentRow()
+        current_row = self.list_view.currentIndex().row()
         new_row = max(0, min(current_row + step, count - 1))
         if new_row != current_row:
-            self.list_widget.setCurrentRow(new_row)
+            self.list_view.setCurrentIndex(self.list_model.index(new_row))
 
     def _clear_image_and_caption(self) -> None:
+        self._wanted_key = None
+        self._source_pix = None
         self.image_label.clear()
         self.caption_edit.clear()
         self.current_image_name = None